@@ -1,4 +1,11 @@
+import csv
+import io
+import time
+import tracemalloc
+from array import array
+from collections import Counter
 from enum import Enum
+from itertools import accumulate, chain, count, filterfalse, islice, repeat
 
 
 class Relationship(Enum):
@@ -10,19 +17,221 @@ class person:
     def __init__(self, name) -> None:
         self.name = name
 
-class Relationships:
+class RelationshipBrowser:
+    # the abstraction high-level modules depend on
+    closure = None
+
+    def find(self, name, relationship):
+        raise NotImplementedError
+
+    def find_all_children_of(self, name):
+        return self.find(name, Relationship.CHILD)
+
+    def walk(self, name, relationship, max_depth=None):
+        """Names reachable from ``name`` in at most ``max_depth`` hops (BFS)."""
+        seen, frontier, depth = set(), [name], 0
+        while frontier and (max_depth is None or depth < max_depth):
+            depth += 1
+            next_frontier = []
+            for current in frontier:
+                for p in self.find(current, relationship):
+                    if p.name not in seen:
+                        seen.add(p.name)
+                        next_frontier.append(p.name)
+            frontier = next_frontier
+        seen.discard(name)
+        return seen
+
+    def ancestors(self, name, max_depth=None):
+        if max_depth is None and self.closure is not None:
+            return set(self.closure.ancestors.get(name, ()))
+        return self.walk(name, Relationship.PARENT, max_depth)
+
+    def descendants(self, name, max_depth=None):
+        if max_depth is None and self.closure is not None:
+            return set(self.closure.descendants.get(name, ()))
+        return self.walk(name, Relationship.CHILD, max_depth)
+
+    def siblings(self, name):
+        result = {child.name
+                  for parent in self.find(name, Relationship.PARENT)
+                  for child in self.find_all_children_of(parent.name)}
+        result.discard(name)
+        return result
+
+    def siblings_of_siblings(self, name):
+        """Siblings of siblings, which adds half-siblings' other siblings."""
+        result = set()
+        for sibling in self.siblings(name):
+            result |= self.siblings(sibling)
+        result.discard(name)
+        return result
+
+class AncestryIndex:
+    """
+    Transitive closure of the parent/child edges: every ancestor and
+    descendant of each name, kept up to date as edges are added.
+    """
+
+    def __init__(self) -> None:
+        self.ancestors = {}
+        self.descendants = {}
+
+    def __call__(self, parent, child):
+        above = {parent.name} | self.ancestors.get(parent.name, set())
+        below = {child.name} | self.descendants.get(child.name, set())
+        for name in above:
+            self.descendants.setdefault(name, set()).update(below)
+        for name in below:
+            self.ancestors.setdefault(name, set()).update(above)
+
+class Relationships(RelationshipBrowser):
     def __init__(self) -> None:
         self.relations = []
+        # name -> Relationship -> related persons
+        self.by_name = {}
+        # Relationship -> (person, Relationship, person) triples
+        self.by_type = {relationship: [] for relationship in Relationship}
+        # called with (parent, child) for every new edge
+        self.listeners = []
+
+    def _add(self, a, relationship, b):
+        triple = (a, relationship, b)
+        self.relations.append(triple)
+        self.by_type[relationship].append(triple)
+        self.by_name.setdefault(a.name, {}).setdefault(
+            relationship, []).append(b)
 
     def add_parent_and_child(self, parent, child):
-        self.relations.append(
-            (parent, Relationship.CHILD, child))
-        self.relations.append(
-            (child, Relationship.PARENT, parent))
+        self._add(parent, Relationship.CHILD, child)
+        self._add(child, Relationship.PARENT, parent)
+        for listener in self.listeners:
+            listener(parent, child)
+
+    def enable_closure(self):
+        """Precompute ancestors/descendants and maintain them from now on."""
+        self.closure = AncestryIndex()
+        for parent, _, child in self.by_type[Relationship.CHILD]:
+            self.closure(parent, child)
+        self.listeners.append(self.closure)
+        return self.closure
+
+    def find(self, name, relationship):
+        return self.by_name.get(name, {}).get(relationship, [])
+
+class CsrRelationships(RelationshipBrowser):
+    """
+    Read-only relationships in compressed sparse row form. Names are
+    interned to integer ids and, for each Relationship kind, the ids
+    related to id ``i`` are ``indices[indptr[i]:indptr[i + 1]]``.
+    """
+
+    def __init__(self, names, ids, adjacency) -> None:
+        self.names = names
+        self.ids = ids
+        # Relationship -> (indptr, indices)
+        self.adjacency = adjacency
+
+    @classmethod
+    def load_csv(cls, fp, chunk_size=1 << 16):
+        """
+        Bulk load ``parent,child`` rows from a CSV stream. Blank lines are
+        skipped; any other row without exactly two fields is a ValueError.
+        """
+        ids = {}
+        parents, children = array("I"), array("I")
+        rows = filter(None, csv.reader(fp))
+        while chunk := list(islice(rows, chunk_size)):
+            if set(map(len, chunk)) != {2}:
+                row = next(row for row in chunk if len(row) != 2)
+                raise ValueError(f"expected a parent,child row, got {row!r}")
+            parent_names, child_names = zip(*chunk)
+            fresh = dict.fromkeys(chain(parent_names, child_names))
+            ids.update(zip(filterfalse(ids.__contains__, fresh),
+                           count(len(ids))))
+            parents.extend(map(ids.__getitem__, parent_names))
+            children.extend(map(ids.__getitem__, child_names))
+        names = [None] * len(ids)
+        for name, i in ids.items():
+            names[i] = name
+        adjacency = {
+            Relationship.CHILD: cls._csr(parents, children, len(names)),
+            Relationship.PARENT: cls._csr(children, parents, len(names)),
+        }
+        return cls(names, ids, adjacency)
+
+    @staticmethod
+    def _csr(sources, targets, n):
+        # counting sort: the degree prefix sums give each source's slice of
+        # indices, and one pass scatters every target into its slice
+        degrees = Counter(sources)
+        indptr = array("Q", accumulate(map(degrees.get, range(n), repeat(0)),
+                                       initial=0))
+        cursor = indptr.tolist()
+        indices = array("I", bytes(len(sources) * array("I").itemsize))
+        for source, target in zip(sources, targets):
+            indices[cursor[source]] = target
+            cursor[source] += 1
+        return indptr, indices
+
+    def find_ids(self, i, relationship):
+        adjacency = self.adjacency.get(relationship)
+        if adjacency is None:
+            return array("I")
+        indptr, indices = adjacency
+        return indices[indptr[i]:indptr[i + 1]]
+
+    def find(self, name, relationship):
+        i = self.ids.get(name)
+        if i is None:
+            return []
+        return [person(self.names[j]) for j in self.find_ids(i, relationship)]
 
 class Research:
-    def __init__(self, relationships) -> None:
-        relations = relationships.relations
-        for r in relations:
-            if r[0].name == "John" and r[1] == Relationship.PARENT:
-                print('Found')
\ No newline at end of file
+    def __init__(self, browser) -> None:
+        self.browser = browser
+        for _ in self.find("John", Relationship.PARENT):
+            print('Found')
+
+    def find(self, name, relationship=Relationship.CHILD):
+        return list(self.browser.find(name, relationship))
+
+
+def benchmark_csr(n=10**6):
+    rows = "".join(f"p{i // 3},p{i + 1}\n" for i in range(n))
+    start = time.perf_counter()
+    CsrRelationships.load_csv(io.StringIO(rows))
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    csr = CsrRelationships.load_csv(io.StringIO(rows))
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"CSR: {n / seconds / 1e6:.2f}M edges/s, {size / n:.1f} bytes/edge")
+    del csr
+    tracemalloc.start()
+    relationships = Relationships()
+    for line in rows.splitlines():
+        parent, child = line.split(",")
+        relationships.add_parent_and_child(person(parent), person(child))
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(f"Relationships: {size / n:.1f} bytes/edge")
+
+
+if __name__ == "__main__":
+    john = person("John")
+    relationships = Relationships()
+    relationships.add_parent_and_child(person("Mike"), john)
+    relationships.add_parent_and_child(john, person("Chris"))
+    relationships.add_parent_and_child(john, person("Matt"))
+    research = Research(relationships)
+    print([p.name for p in research.find("John")])
+    print(sorted(relationships.descendants("Mike")),
+          sorted(relationships.ancestors("Matt", max_depth=1)))
+    relationships.enable_closure()
+    relationships.add_parent_and_child(person("Chris"), person("Ann"))
+    print(sorted(relationships.descendants("Mike")),
+          sorted(relationships.siblings("Chris")))
+    csr = CsrRelationships.load_csv(io.StringIO("Mike,John\nJohn,Chris\n"))
+    print([p.name for p in Research(csr).find("John")])
+    # benchmark_csr()
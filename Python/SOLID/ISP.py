@@ -1,3 +1,9 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
 class Machine:
     def print(self, document):
         raise NotImplementedError
@@ -9,7 +15,22 @@ class Machine:
         raise NotImplementedError
 
 
-class MultiFunctionPrinter(Machine):
+class Printer:
+    def print(self, document):
+        raise NotImplementedError
+
+
+class Scanner:
+    def scan(self, document):
+        raise NotImplementedError
+
+
+class FaxMachine:
+    def fax(self, document):
+        raise NotImplementedError
+
+
+class MultiFunctionPrinter(Machine, Printer, Scanner, FaxMachine):
     def print(self, document):
         pass
 
@@ -18,3 +39,152 @@ class MultiFunctionPrinter(Machine):
 
     def scan(self, document):
         pass
+
+
+class Photocopier(Printer, Scanner):
+    def print(self, document):
+        pass
+
+    def scan(self, document):
+        pass
+
+
+# job role -> the segregated interface a device needs to take that role
+ROLES = {"print": Printer, "scan": Scanner, "fax": FaxMachine}
+
+
+class Lane:
+    """Bounded queue and worker threads for one role."""
+
+    def __init__(self, role, queue_size) -> None:
+        self.role = role
+        self.jobs = queue.Queue(queue_size)
+        self.workers = []
+        self.submitted = self.completed = self.failed = 0
+        # running totals rather than one sample per job
+        self._latency_total = self._latency_max = 0.0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add_device(self, device, workers):
+        for _ in range(workers):
+            worker = threading.Thread(target=self._run, args=(device,),
+                                      daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def _run(self, device):
+        action = getattr(device, self.role)
+        while (job := self.jobs.get()) is not None:
+            future, document, submitted = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(action(document))
+                failed = 0
+            except Exception as e:
+                future.set_exception(e)
+                failed = 1
+            with self._lock:
+                self.completed += 1 - failed
+                self.failed += failed
+                latency = time.perf_counter() - submitted
+                self._latency_total += latency
+                self._latency_max = max(self._latency_max, latency)
+
+    def metrics(self):
+        with self._lock:
+            finished = self.completed + self.failed
+            return {"queue_depth": self.jobs.qsize(),
+                    "submitted": self.submitted,
+                    "completed": self.completed, "failed": self.failed,
+                    "throughput": self.completed
+                    / (time.perf_counter() - self.started),
+                    "mean_latency": self._latency_total / max(finished, 1),
+                    "max_latency": self._latency_max}
+
+
+class JobEngine:
+    """
+    Runs print, scan and fax jobs concurrently. Each role has its own
+    bounded queue and workers, so a slow fax never holds up printing,
+    and a device only joins the lanes of the interfaces it implements.
+    """
+
+    def __init__(self, workers_per_device=1, queue_size=64) -> None:
+        self.workers_per_device = workers_per_device
+        self.queue_size = queue_size
+        self.lanes = {}
+        self.closed = False
+        # submits that passed the closed check but have not queued yet
+        self._putting = 0
+        self._cond = threading.Condition()
+
+    def register(self, device):
+        roles = [role for role, interface in ROLES.items()
+                 if isinstance(device, interface)]
+        for role in roles:
+            lane = self.lanes.get(role)
+            if lane is None:
+                lane = self.lanes[role] = Lane(role, self.queue_size)
+            lane.add_device(device, self.workers_per_device)
+        return roles
+
+    def submit(self, role, document, timeout=None) -> Future:
+        """
+        Queue a job and return its future. Blocks while the role's queue
+        is full and raises queue.Full if ``timeout`` runs out first.
+        Raises RuntimeError once the engine has been shut down.
+        """
+        lane = self.lanes.get(role)
+        if lane is None:
+            raise ValueError(f"no registered device can {role}")
+        future = Future()
+        with self._cond:
+            if self.closed:
+                raise RuntimeError("cannot submit after shutdown")
+            self._putting += 1
+        try:
+            lane.jobs.put((future, document, time.perf_counter()),
+                          timeout=timeout)
+        finally:
+            with self._cond:
+                self._putting -= 1
+                self._cond.notify_all()
+        with lane._lock:
+            lane.submitted += 1
+        return future
+
+    def metrics(self):
+        return {role: lane.metrics() for role, lane in self.lanes.items()}
+
+    def shutdown(self):
+        with self._cond:
+            self.closed = True
+            # jobs still being queued must land ahead of the stop markers
+            self._cond.wait_for(lambda: not self._putting)
+        for lane in self.lanes.values():
+            for _ in lane.workers:
+                lane.jobs.put(None)
+            for worker in lane.workers:
+                worker.join()
+
+
+if __name__ == "__main__":
+    class SlowFax(FaxMachine):
+        def fax(self, document):
+            time.sleep(0.1)
+            return f"faxed {document}"
+
+    engine = JobEngine(workers_per_device=2, queue_size=8)
+    print(engine.register(Photocopier()), engine.register(SlowFax()))
+    faxes = [engine.submit("fax", f"fax {i}") for i in range(4)]
+    prints = [engine.submit("print", f"page {i}") for i in range(100)]
+    for f in prints:
+        f.result()
+    print("printing done while faxes pending:",
+          sum(not f.done() for f in faxes))
+    print([f.result() for f in faxes])
+    engine.shutdown()
+    for role, metrics in engine.metrics().items():
+        print(role, metrics)
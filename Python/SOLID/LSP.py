@@ -1,3 +1,10 @@
+import timeit
+from array import array
+from itertools import repeat
+from numbers import Number
+from operator import getitem, mul
+
+
 class Rectangle:
     def __init__(self, height, width) -> None:
         self._height = height
@@ -37,11 +44,127 @@ class Square(Rectangle):
     def height(self, value):
         self._width = self._height = value
 
+class _ArrayBacked:
+    # _width/_height live in a ShapeArray, so the inherited
+    # Rectangle/Square properties read and write the arrays directly
+    def __init__(self, shapes, index) -> None:
+        self._shapes = shapes
+        self._index = index
+
+    @property
+    def _width(self):
+        return self._shapes.widths[self._index]
+
+    @_width.setter
+    def _width(self, value):
+        self._shapes.widths[self._index] = value
+
+    @property
+    def _height(self):
+        return self._shapes.heights[self._index]
+
+    @_height.setter
+    def _height(self, value):
+        self._shapes.heights[self._index] = value
+
+class RectangleView(_ArrayBacked, Rectangle):
+    pass
+
+class SquareView(_ArrayBacked, Square):
+    pass
+
+class ShapeArray:
+    """
+    Many rectangles and squares stored as columns: widths, heights and a
+    square flag per shape. Bulk writes keep height == width for squares.
+    """
+
+    def __init__(self) -> None:
+        self.widths = array("d")
+        self.heights = array("d")
+        self.square = bytearray()
+
+    @classmethod
+    def from_shapes(cls, shapes):
+        result = cls()
+        for shape in shapes:
+            result.append(shape)
+        return result
+
+    def append(self, shape: Rectangle):
+        self.widths.append(shape.width)
+        self.heights.append(shape.height)
+        self.square.append(isinstance(shape, Square))
+
+    def __len__(self):
+        return len(self.widths)
+
+    def __getitem__(self, index):
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        index %= len(self)
+        view = SquareView if self.square[index] else RectangleView
+        return view(self, index)
+
+    def __iter__(self):
+        return map(self.__getitem__, range(len(self)))
+
+    @property
+    def area(self):
+        return array("d", map(mul, self.widths, self.heights))
+
+    def _column(self, values):
+        if isinstance(values, Number):
+            return array("d", repeat(values, len(self)))
+        column = array("d", values)
+        if len(column) != len(self):
+            raise ValueError(f"expected {len(self)} values, got {len(column)}")
+        return column
+
+    def _square_up(self, source, target):
+        # target[i] = source[i] wherever shape i is a square
+        return array("d", map(getitem, zip(target, source), self.square))
+
+    def set_widths(self, values):
+        self.widths = self._column(values)
+        self.heights = self._square_up(self.widths, self.heights)
+
+    def set_heights(self, values):
+        self.heights = self._column(values)
+        self.widths = self._square_up(self.heights, self.widths)
+
+    def resize(self, width_factor, height_factor=None):
+        """Scale every shape; squares scale both sides by ``width_factor``."""
+        if height_factor is None:
+            height_factor = width_factor
+        self.widths = array("d", map(mul, self.widths, repeat(width_factor)))
+        self.heights = self._square_up(
+            self.widths, array("d", map(mul, self.heights,
+                                        repeat(height_factor))))
+
+def benchmark_area(n=10**6):
+    shapes = [Square(i % 10) if i % 2 else Rectangle(i % 7, i % 5)
+              for i in range(n)]
+    columns = ShapeArray.from_shapes(shapes)
+    objects = min(timeit.repeat(lambda: [s.area for s in shapes],
+                                number=1, repeat=3))
+    vectorized = min(timeit.repeat(lambda: columns.area, number=1, repeat=3))
+    print(f"{n} areas: objects {objects:.4f}s, ShapeArray {vectorized:.4f}s")
+
 def use_it(rc: Rectangle):
     w = rc.width
     rc.height = 10
     expected = int(w*10)
     print(f'e: {expected}, g: {rc.area}')
 
-rc = Rectangle(2, 3)
-use_it(rc)
\ No newline at end of file
+
+if __name__ == "__main__":
+    rc = Rectangle(2, 3)
+    use_it(rc)
+
+    shapes = ShapeArray.from_shapes([Rectangle(2, 3), Square(4)])
+    for shape in shapes:
+        use_it(shape)
+    shapes.set_widths([5, 6])
+    print(list(shapes.area))
+    # benchmark_area()
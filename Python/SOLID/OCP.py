@@ -1,3 +1,16 @@
+import asyncio
+import csv
+import json
+import os
+import re
+import threading
+import timeit
+import tracemalloc
+from array import array
+from collections import Counter, OrderedDict
+from itertools import compress, islice
+from multiprocessing import Pool, shared_memory
+from operator import itemgetter
 from enum import Enum
 from typing import List
 
@@ -14,6 +27,13 @@ class Size(Enum):
     LARGE = 3
 
 
+# integer codes used by the column stores
+COLORS = tuple(Color)
+SIZES = tuple(Size)
+COLOR_CODES = {color: code for code, color in enumerate(COLORS)}
+SIZE_CODES = {size: code for code, size in enumerate(SIZES)}
+
+
 class Product:
     name: str
     color: Color
@@ -25,6 +45,42 @@ class Product:
         self.size = size
 
 
+class CompactProduct:
+    """
+    Product with no ``__dict__``: color and size are kept as their small int
+    codes and turned back into enum members on access.
+    """
+    __slots__ = ("name", "_color", "_size")
+
+    def __init__(self, name, color, size) -> None:
+        # tuple.index compares by identity in C; Enum.__hash__ is Python code
+        self.name = name
+        self._color = COLORS.index(color)
+        self._size = SIZES.index(size)
+
+    @property
+    def color(self) -> Color:
+        return COLORS[self._color]
+
+    @property
+    def size(self) -> Size:
+        return SIZES[self._size]
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build products from (name, color, size) rows."""
+        new, color_code, size_code = object.__new__, COLORS.index, SIZES.index
+        products = []
+        append = products.append
+        for name, color, size in rows:
+            product = new(cls)
+            product.name = name
+            product._color = color_code(color)
+            product._size = size_code(size)
+            append(product)
+        return products
+
+
 class ProductFilter:
     def filter_by_color(self, products: List[Product], color):
         for p in products:
@@ -38,9 +94,77 @@ class ProductFilter:
 
 
 class Specification:
+    # relative cost of one is_satisfied call, used by the QueryPlanner
+    cost = 5.0
+
     def is_satisfied(self, item) -> bool:
         pass
 
+    def bitmap(self, catalog):
+        # None means "no index can answer this", so the caller scans
+        return None
+
+    def indexed(self):
+        return False
+
+    def selectivity(self, catalog):
+        """Estimated fraction of the catalog that satisfies the spec."""
+        return 0.5
+
+    def key(self):
+        """
+        Structural identity: specs with equal keys select the same items.
+        None (the default) falls back to object identity.
+        """
+        return None
+
+    def __eq__(self, other):
+        if not isinstance(other, Specification):
+            return NotImplemented
+        key = self.key()
+        return self is other if key is None else key == other.key()
+
+    def __hash__(self):
+        key = self.key()
+        return object.__hash__(self) if key is None else hash(key)
+
+    def source(self, env):
+        """
+        Python expression testing ``item`` against this spec; objects the
+        expression needs are bound into ``env``.
+        """
+        name = f"_s{len(env)}"
+        env[name] = self.is_satisfied
+        return f"{name}(item)"
+
+    def compile(self):
+        """
+        Flatten the spec tree into a single predicate callable. The result
+        is kept on the spec, so specs should not be mutated once used.
+        """
+        compiled = self.__dict__.get("_compiled")
+        if compiled is None:
+            env = {}
+            compiled = eval(f"lambda item: {self.source(env)}", env)
+            self._compiled = compiled
+        return compiled
+
+    def __getstate__(self):
+        # the compiled lambda does not pickle; workers recompile it
+        state = self.__dict__.copy()
+        state.pop("_compiled", None)
+        return state
+
+    def mask(self, store):
+        """One byte per row of ``store``: 1 where the row satisfies the spec."""
+        return bytes(map(bool, map(self.compile(), store)))
+
+    def __or__(self, other):
+        return OrSpecification(self, other)
+
+    def __invert__(self):
+        return NotSpecification(self)
+
     def __and__(self, other):
         return AndSpecification(self, other)
 
@@ -50,7 +174,74 @@ class Filter:
         pass
 
 
-class ColorSpecification(Specification):
+class _FieldSpecification(Specification):
+    """
+    Base of the specs matching one Product field against a value. As long
+    as a subclass keeps the is_satisfied it was declared with, these are
+    answered from the catalog bitmaps and store columns, and compile to an
+    inline comparison.
+    """
+    cost = 1.0
+    # Product attribute compared (also the spec's own attribute holding the
+    # value), value -> byte code of the store column, the ProductCatalog
+    # bitmap accessor and its per-value counts
+    field = None
+    column = None
+    codes = None
+    bitmap_of = None
+    counts = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if _FieldSpecification in cls.__bases__:
+            cls._declared = cls.is_satisfied
+
+    @property
+    def value(self):
+        return getattr(self, self.field)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.value})"
+
+    def key(self):
+        return type(self), self.value
+
+    def _builtin(self):
+        # a subclass that overrides is_satisfied must be called, not inlined
+        cls = type(self)
+        return cls.is_satisfied is cls._declared
+
+    def bitmap(self, catalog):
+        if not self._builtin():
+            return None
+        return getattr(catalog, self.bitmap_of)(self.value)
+
+    def indexed(self):
+        return self._builtin()
+
+    def selectivity(self, catalog):
+        if not self._builtin():
+            return super().selectivity(catalog)
+        counts = getattr(catalog, self.counts)
+        return counts[self.value] / max(len(catalog), 1)
+
+    def mask(self, store):
+        if not self._builtin():
+            return super().mask(store)
+        return _code_mask(getattr(store, self.column), self.codes[self.value])
+
+    def source(self, env):
+        if not self._builtin():
+            return super().source(env)
+        name = f"_v{len(env)}"
+        env[name] = self.value
+        return f"item.{self.field} == {name}"
+
+
+class ColorSpecification(_FieldSpecification):
+    field, column, codes = "color", "colors", COLOR_CODES
+    bitmap_of, counts = "color_bitmap", "color_counts"
+
     def __init__(self, color) -> None:
         self.color = color
 
@@ -58,7 +249,10 @@ class ColorSpecification(Specification):
         return item.color == self.color
 
 
-class SizeSpecification(Specification):
+class SizeSpecification(_FieldSpecification):
+    field, column, codes = "size", "sizes", SIZE_CODES
+    bitmap_of, counts = "size_bitmap", "size_counts"
+
     def __init__(self, size) -> None:
         self.size = size
 
@@ -69,17 +263,796 @@ class AndSpecification(Specification):
     def __init__(self, *args) -> None:
         self.args = args
 
+    def __repr__(self) -> str:
+        return " & ".join(map(repr, self.args)).join("()")
+
+    def key(self):
+        return type(self), self.args
+
+    @property
+    def cost(self):
+        return sum(spec.cost for spec in self.args)
+
     def is_satisfied(self, item) -> bool:
         return all(map(
             lambda spec: spec.is_satisfied(item), self.args
         ))
 
+    def bitmap(self, catalog):
+        result = None
+        for spec in self.args:
+            bits = spec.bitmap(catalog)
+            if bits is None:
+                return None
+            result = bits if result is None else result & bits
+        return result
+
+    def indexed(self):
+        return all(spec.indexed() for spec in self.args)
+
+    def selectivity(self, catalog):
+        result = 1.0
+        for spec in self.args:
+            result *= spec.selectivity(catalog)
+        return result
+
+    def mask(self, store):
+        result = int.from_bytes(self.args[0].mask(store), "little")
+        for spec in self.args[1:]:
+            result &= int.from_bytes(spec.mask(store), "little")
+        return result.to_bytes(len(store), "little")
+
+    def source(self, env):
+        return "(" + " and ".join(spec.source(env) for spec in self.args) + ")"
+
+class OrSpecification(Specification):
+    def __init__(self, *args) -> None:
+        self.args = args
+
+    def __repr__(self) -> str:
+        return " | ".join(map(repr, self.args)).join("()")
+
+    def key(self):
+        return type(self), self.args
+
+    @property
+    def cost(self):
+        return sum(spec.cost for spec in self.args)
+
+    def is_satisfied(self, item) -> bool:
+        return any(spec.is_satisfied(item) for spec in self.args)
+
+    def bitmap(self, catalog):
+        result = 0
+        for spec in self.args:
+            bits = spec.bitmap(catalog)
+            if bits is None:
+                return None
+            result |= bits
+        return result
+
+    def indexed(self):
+        return all(spec.indexed() for spec in self.args)
+
+    def selectivity(self, catalog):
+        miss = 1.0
+        for spec in self.args:
+            miss *= 1.0 - spec.selectivity(catalog)
+        return 1.0 - miss
+
+    def mask(self, store):
+        result = 0
+        for spec in self.args:
+            result |= int.from_bytes(spec.mask(store), "little")
+        return result.to_bytes(len(store), "little")
+
+    def source(self, env):
+        return "(" + " or ".join(spec.source(env) for spec in self.args) + ")"
+
+class NotSpecification(Specification):
+    def __init__(self, spec) -> None:
+        self.spec = spec
+
+    def __repr__(self) -> str:
+        return f"~{self.spec!r}"
+
+    def key(self):
+        return type(self), self.spec
+
+    @property
+    def cost(self):
+        return self.spec.cost
+
+    def is_satisfied(self, item) -> bool:
+        return not self.spec.is_satisfied(item)
+
+    def bitmap(self, catalog):
+        bits = self.spec.bitmap(catalog)
+        if bits is None:
+            return None
+        return bits ^ catalog.live_bitmap()
+
+    def indexed(self):
+        return self.spec.indexed()
+
+    def selectivity(self, catalog):
+        return 1.0 - self.spec.selectivity(catalog)
+
+    def mask(self, store):
+        return self.spec.mask(store).translate(_NOT_TABLE)
+
+    def source(self, env):
+        return f"not {self.spec.source(env)}"
+
 class BetterFilter(Filter):
     def filter(self, items, spec: Specification):
-        for item in items:
-            if spec.is_satisfied(item):
+        yield from filter(spec.compile(), items)
+
+    async def afilter(self, items, spec: Specification):
+        """Async version of filter over an async iterator of products."""
+        predicate = spec.compile()
+        async for item in items:
+            if predicate(item):
                 yield item
 
+    def filter_mask(self, store, spec: Specification):
+        """Indices of the rows of a ProductStore that satisfy ``spec``."""
+        return array("q", compress(range(len(store)), spec.mask(store)))
+
+
+_NOT_TABLE = bytes([1, 0]) + bytes(254)
+
+
+def read_products(fp, format="csv", chunk_size=10_000):
+    """
+    Yield lists of at most ``chunk_size`` products parsed from ``fp``: CSV
+    rows of ``name,COLOR,SIZE`` or JSONL objects with the same three keys.
+    """
+    if format == "csv":
+        rows = csv.reader(fp)
+    elif format == "jsonl":
+        rows = map(itemgetter("name", "color", "size"), map(json.loads, fp))
+    else:
+        raise ValueError(f"unknown format {format!r}")
+    while chunk := [Product(name, Color[color], Size[size])
+                    for name, color, size in islice(rows, chunk_size)]:
+        yield chunk
+
+
+async def aread_products(path, format="csv", chunk_size=10_000, prefetch=2):
+    """
+    Async iterator of the products in ``path``. A worker thread parses
+    ahead while the consumer runs, holding at most ``prefetch`` chunks.
+    Errors raised while reading or parsing are re-raised in the consumer.
+    """
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue()
+    # one slot per chunk the producer may have parsed but not handed over
+    slots = threading.Semaphore(prefetch)
+    stop = threading.Event()
+
+    def produce():
+        try:
+            with open(path, newline="") as fp:
+                for chunk in read_products(fp, format, chunk_size):
+                    slots.acquire()
+                    if stop.is_set():
+                        return
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+            end = None
+        except BaseException as e:
+            end = e
+        # the end marker takes no slot, so it can always be delivered
+        loop.call_soon_threadsafe(chunks.put_nowait, end)
+
+    producer = loop.run_in_executor(None, produce)
+    try:
+        while (chunk := await chunks.get()) is not None:
+            if isinstance(chunk, BaseException):
+                raise chunk
+            slots.release()
+            for product in chunk:
+                yield product
+    finally:
+        # wake the producer if the consumer stopped early
+        stop.set()
+        slots.release()
+        await producer
+
+
+def _code_mask(column, code):
+    table = bytearray(256)
+    table[code] = 1
+    return column.translate(table)
+
+
+class ProductStore:
+    """
+    Products kept column-wise: names in a list, colors and sizes as
+    one byte code per row, so built-in specs evaluate as whole-column masks.
+    """
+
+    def __init__(self, names=None, colors=None, sizes=None) -> None:
+        self.names = names if names is not None else []
+        self.colors = colors if colors is not None else bytearray()
+        self.sizes = sizes if sizes is not None else bytearray()
+
+    @classmethod
+    def from_products(cls, products):
+        store = cls()
+        for product in products:
+            store.append(product)
+        return store
+
+    def append(self, product):
+        self.names.append(product.name)
+        self.colors.append(COLOR_CODES[product.color])
+        self.sizes.append(SIZE_CODES[product.size])
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, i):
+        return Product(self.names[i], COLORS[self.colors[i]],
+                       SIZES[self.sizes[i]])
+
+    def __iter__(self):
+        return map(Product, self.names,
+                   map(COLORS.__getitem__, self.colors),
+                   map(SIZES.__getitem__, self.sizes))
+
+
+# bit positions set in each byte value, used to decode bitmaps
+_BIT_POSITIONS = [
+    tuple(i for i in range(8) if value >> i & 1) for value in range(256)
+]
+
+
+def iter_bits(bits):
+    """Yield the positions of the set bits of ``bits`` in ascending order."""
+    data = bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+    for match in re.finditer(rb"[^\x00]", data):
+        base = match.start()
+        for offset in _BIT_POSITIONS[data[base]]:
+            yield (base << 3) + offset
+
+
+class ProductCatalog:
+    """
+    Products addressed by id, with one bitmap per Color and Size value.
+    Bit ``i`` of a value's bitmap is set when product ``i`` has that value.
+    Removed ids are left empty rather than reused.
+    """
+
+    def __init__(self, products=()) -> None:
+        self.products = []
+        self._live = bytearray()
+        self._colors = {color: bytearray() for color in Color}
+        self._sizes = {size: bytearray() for size in Size}
+        self._cache = {}
+        self._size = 0
+        # bumped on every change, so cached results can tell they are stale
+        self.version = 0
+        self.color_counts = Counter()
+        self.size_counts = Counter()
+        self.views = []
+        for product in products:
+            self.add(product)
+
+    def _index(self, pid, product, on=True):
+        byte, bit = pid >> 3, 1 << (pid & 7)
+        step = 1 if on else -1
+        for bitmap in (self._live, self._colors[product.color],
+                       self._sizes[product.size]):
+            if on:
+                bitmap[byte] |= bit
+            else:
+                bitmap[byte] &= ~bit
+        self.color_counts[product.color] += step
+        self.size_counts[product.size] += step
+        self._size += step
+        self.version += 1
+        self._cache.clear()
+
+    def add(self, product):
+        pid = len(self.products)
+        if pid % 8 == 0:
+            for bitmap in (self._live, *self._colors.values(),
+                           *self._sizes.values()):
+                bitmap.append(0)
+        self.products.append(product)
+        self._index(pid, product)
+        for view in self.views:
+            view._insert(pid, product)
+        return pid
+
+    def __getitem__(self, pid):
+        if not 0 <= pid < len(self.products):
+            raise IndexError(f"no product with id {pid}")
+        product = self.products[pid]
+        if product is None:
+            raise KeyError(f"product {pid} was removed")
+        return product
+
+    def remove(self, pid):
+        product = self[pid]
+        self._index(pid, product, on=False)
+        self.products[pid] = None
+        for view in self.views:
+            view._delete(pid)
+        return product
+
+    def update(self, pid, product):
+        self._index(pid, self[pid], on=False)
+        self.products[pid] = product
+        self._index(pid, product)
+        for view in self.views:
+            view._replace(pid, product)
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        return (product for product in self.products if product is not None)
+
+    def items(self):
+        """(id, product) pairs of the products still in the catalog."""
+        return ((pid, product) for pid, product in enumerate(self.products)
+                if product is not None)
+
+    def _bitmap(self, index, value):
+        key = (id(index), value)
+        if key not in self._cache:
+            self._cache[key] = int.from_bytes(index[value], "little")
+        return self._cache[key]
+
+    def live_bitmap(self):
+        if "live" not in self._cache:
+            self._cache["live"] = int.from_bytes(self._live, "little")
+        return self._cache["live"]
+
+    def color_bitmap(self, color):
+        return self._bitmap(self._colors, color)
+
+    def size_bitmap(self, size):
+        return self._bitmap(self._sizes, size)
+
+    def register_view(self, spec: Specification):
+        """
+        Start maintaining the products that satisfy ``spec``. The view is
+        updated on every add/update/remove, so reading it costs O(result).
+        """
+        view = LiveView(spec)
+        bits = spec.bitmap(self)
+        if bits is not None:
+            view.rows = {pid: self.products[pid] for pid in iter_bits(bits)}
+        else:
+            view.rows = {pid: product for pid, product in self.items()
+                         if view.predicate(product)}
+        self.views.append(view)
+        return view
+
+    def unregister_view(self, view):
+        self.views.remove(view)
+
+
+class LiveView:
+    """Result set of a spec registered with ProductCatalog.register_view."""
+
+    def __init__(self, spec: Specification) -> None:
+        self.spec = spec
+        self.predicate = spec.compile()
+        self.rows = {}
+        # False once an update has inserted an id below the largest one
+        self._ordered = True
+
+    def _insert(self, pid, product):
+        if self.predicate(product):
+            rows = self.rows
+            if rows and pid not in rows and pid < next(reversed(rows)):
+                self._ordered = False
+            rows[pid] = product
+
+    def _delete(self, pid):
+        self.rows.pop(pid, None)
+
+    def _replace(self, pid, product):
+        if self.predicate(product):
+            self._insert(pid, product)
+        else:
+            self._delete(pid)
+
+    def _sorted_rows(self):
+        if not self._ordered:
+            self.rows = dict(sorted(self.rows.items()))
+            self._ordered = True
+        return self.rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self._sorted_rows().values())
+
+    def ids(self):
+        return self._sorted_rows().keys()
+
+
+def conjuncts(spec):
+    """The children of a (possibly nested) AndSpecification, flattened."""
+    if isinstance(spec, AndSpecification):
+        for child in spec.args:
+            yield from conjuncts(child)
+    else:
+        yield spec
+
+
+def scan_cost(specs, catalog):
+    """Expected predicate cost per item of testing ``specs`` in order."""
+    cost, reach = 0.0, 1.0
+    for spec in specs:
+        cost += reach * spec.cost
+        reach *= spec.selectivity(catalog)
+    return cost
+
+
+class QueryPlan:
+    def __init__(self, catalog, index_specs, residual, cost) -> None:
+        self.catalog = catalog
+        self.index_specs = index_specs
+        self.residual = residual
+        self.cost = cost
+
+    def explain(self) -> str:
+        n = len(self.catalog)
+        lines = [f"estimated cost: {self.cost:.1f} over {n} products"]
+        if self.index_specs:
+            rows = n
+            for spec in self.index_specs:
+                rows *= spec.selectivity(self.catalog)
+            lines.append(f"index: {' & '.join(map(repr, self.index_specs))}"
+                         f" (~{rows:.0f} rows)")
+        else:
+            lines.append("scan: all products")
+        for spec in self.residual:
+            lines.append(f"  then test {spec!r} "
+                         f"(selectivity {spec.selectivity(self.catalog):.3f})")
+        return "\n".join(lines)
+
+    def execute(self):
+        products = self.catalog.products
+        if self.index_specs:
+            bits = AndSpecification(*self.index_specs).bitmap(self.catalog)
+            items = map(products.__getitem__, iter_bits(bits))
+        else:
+            items = iter(self.catalog)
+        if not self.residual:
+            return items
+        return filter(AndSpecification(*self.residual).compile(), items)
+
+
+class QueryPlanner:
+    """
+    Orders a conjunction so cheap, selective children are tested first,
+    and picks the catalog index over a scan when it is estimated cheaper.
+    """
+
+    # cost of combining one bitmap, per product in the catalog
+    bitmap_cost = 1 / 64
+
+    def __init__(self, catalog) -> None:
+        self.catalog = catalog
+
+    def _order(self, specs):
+        def rank(spec):
+            selectivity = spec.selectivity(self.catalog)
+            return spec.cost / max(1.0 - selectivity, 1e-9)
+        return sorted(specs, key=rank)
+
+    def plan(self, spec: Specification) -> QueryPlan:
+        catalog, n = self.catalog, len(self.catalog)
+        children = list(conjuncts(spec))
+        scan = self._order(children)
+        best = QueryPlan(catalog, [], scan, n * scan_cost(scan, catalog))
+
+        index_specs = self._order(
+            [child for child in children if child.indexed()])
+        if index_specs:
+            residual = self._order(
+                [child for child in children if not child.indexed()])
+            rows = n
+            for child in index_specs:
+                rows *= child.selectivity(catalog)
+            cost = (n * self.bitmap_cost * len(index_specs)
+                    + rows * (1 + scan_cost(residual, catalog)))
+            if cost < best.cost:
+                best = QueryPlan(catalog, index_specs, residual, cost)
+        return best
+
+
+class IndexedFilter(Filter):
+    """
+    Answers specs from the catalog bitmaps where the QueryPlanner finds
+    that cheaper; other specs fall back to an ordered scan.
+    """
+
+    def filter(self, catalog: ProductCatalog, spec: Specification):
+        yield from QueryPlanner(catalog).plan(spec).execute()
+
+
+class SharedProductStore:
+    """
+    Copies the color and size columns of a ProductStore into shared memory
+    blocks that worker processes attach to by name.
+    """
+
+    def __init__(self, store: ProductStore) -> None:
+        self.names = store.names
+        self.blocks = []
+        for column in (store.colors, store.sizes):
+            block = shared_memory.SharedMemory(create=True,
+                                               size=max(len(column), 1))
+            block.buf[:len(column)] = column
+            self.blocks.append(block)
+
+    def __len__(self):
+        return len(self.names)
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# per-process state set up by _attach_worker
+_shared = {}
+
+
+def _attach_worker(block_names, names):
+    _shared["blocks"] = [shared_memory.SharedMemory(name=name)
+                         for name in block_names]
+    _shared["names"] = names
+
+
+def _filter_chunk(task):
+    start, stop, spec = task
+    colors, sizes = _shared["blocks"]
+    chunk = ProductStore(_shared["names"][start:stop],
+                         bytes(colors.buf[start:stop]),
+                         bytes(sizes.buf[start:stop]))
+    return array("q", compress(range(start, stop), spec.mask(chunk)))
+
+
+class ParallelFilter(Filter):
+    """
+    Evaluates a spec over a SharedProductStore in a process pool, one
+    chunk of rows per task. Specs travel to the workers by pickle, so
+    custom Specification subclasses must be importable module-level classes.
+    """
+
+    def __init__(self, processes=None, chunk_size=1 << 20) -> None:
+        self.processes = processes or os.cpu_count()
+        self.chunk_size = chunk_size
+        self._pool = None
+        self._store = None
+
+    def _pool_for(self, store: SharedProductStore):
+        if self._store is not store:
+            self.close()
+            names = [block.name for block in store.blocks]
+            # with fork the names list reaches the workers without pickling
+            self._pool = Pool(self.processes, _attach_worker,
+                              (names, store.names))
+            self._store = store
+        return self._pool
+
+    def filter_ids(self, store: SharedProductStore, spec: Specification):
+        n, step = len(store), self.chunk_size
+        tasks = [(start, min(start + step, n), spec)
+                 for start in range(0, n, step)]
+        result = array("q")
+        for ids in self._pool_for(store).imap(_filter_chunk, tasks):
+            result.extend(ids)
+        return result
+
+    def filter(self, store: SharedProductStore, spec: Specification):
+        names, colors, sizes = store.names, *store.blocks
+        for i in self.filter_ids(store, spec):
+            yield Product(names[i], COLORS[colors.buf[i]], SIZES[sizes.buf[i]])
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = self._store = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CachedFilter(Filter):
+    """
+    Bounded LRU of filter results keyed by (spec, catalog version). Specs
+    are compared structurally, so rebuilding an equal spec still hits.
+    """
+
+    def __init__(self, maxsize=128, inner: Filter = None) -> None:
+        self.maxsize = maxsize
+        self.inner = inner or IndexedFilter()
+        self.results = OrderedDict()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+        self._catalog = None
+        self._version = None
+
+    def filter(self, catalog: ProductCatalog, spec: Specification):
+        if catalog is not self._catalog or catalog.version != self._version:
+            if self.results:
+                self.invalidations += 1
+                self.results.clear()
+            self._catalog, self._version = catalog, catalog.version
+        key = (spec, catalog.version)
+        result = self.results.get(key)
+        if result is None:
+            self.misses += 1
+            result = self.results[key] = tuple(self.inner.filter(catalog, spec))
+            if len(self.results) > self.maxsize:
+                self.results.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.hits += 1
+            self.results.move_to_end(key)
+        yield from result
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "size": len(self.results)}
+
+
+def benchmark_compiled(n=10**6, repeat=3):
+    colors, sizes = list(Color), list(Size)
+    products = [
+        Product(str(i), colors[i % 3], sizes[i // 3 % 3]) for i in range(n)
+    ]
+    spec = (ColorSpecification(Color.GREEN) & SizeSpecification(Size.LARGE)
+            & ~ColorSpecification(Color.RED))
+    predicate = spec.compile()
+    for label, test in (("interpreted", spec.is_satisfied),
+                        ("compiled", predicate)):
+        best = min(timeit.repeat(lambda: sum(map(test, products)),
+                                 number=1, repeat=repeat))
+        print(f"{label:>12}: {n / best / 1e6:.2f}M items/s")
+
+
+def benchmark_mask(n=10**7, repeat=3):
+    colors, sizes = list(Color), list(Size)
+    products = [
+        Product(str(i), colors[i % 3], sizes[i // 3 % 3]) for i in range(n)
+    ]
+    store = ProductStore.from_products(products)
+    spec = ColorSpecification(Color.GREEN) & SizeSpecification(Size.LARGE)
+    bf = BetterFilter()
+    scan = min(timeit.repeat(lambda: list(bf.filter(products, spec)),
+                             number=1, repeat=repeat))
+    masked = min(timeit.repeat(lambda: bf.filter_mask(store, spec),
+                               number=1, repeat=repeat))
+    print(f"{n} rows: filter {scan:.4f}s, filter_mask {masked:.4f}s, "
+          f"x{scan / masked:.1f}")
+
+
+def benchmark_planner(n=10**6, repeat=3):
+    # skewed catalog: almost everything is green and small
+    products = [
+        Product(str(i), Color.RED if i % 1000 == 0 else Color.GREEN,
+                Size.LARGE if i % 7 == 0 else Size.SMALL)
+        for i in range(n)
+    ]
+    catalog = ProductCatalog(products)
+    spec = (SizeSpecification(Size.SMALL) & ColorSpecification(Color.GREEN)
+            & ColorSpecification(Color.RED))
+    plan = QueryPlanner(catalog).plan(spec)
+    print(plan.explain())
+    given = min(timeit.repeat(lambda: list(BetterFilter().filter(products, spec)),
+                              number=1, repeat=repeat))
+    planned = min(timeit.repeat(lambda: list(plan.execute()),
+                                number=1, repeat=repeat))
+    print(f"given order {given:.4f}s, planned {planned:.4f}s")
+
+
+class NameLengthSpecification(Specification):
+    def __init__(self, length) -> None:
+        self.length = length
+
+    def is_satisfied(self, item):
+        return len(item.name) == self.length
+
+
+def benchmark_parallel(n=10**7, repeat=3, chunk_size=1 << 18):
+    colors, sizes = list(Color), list(Size)
+    store = ProductStore(
+        [str(i) for i in range(n)],
+        bytearray(COLOR_CODES[colors[i % 3]] for i in range(n)),
+        bytearray(SIZE_CODES[sizes[i // 3 % 3]] for i in range(n)))
+    # a custom spec has no mask of its own, so it shows the CPU-bound path
+    spec = ColorSpecification(Color.GREEN) & NameLengthSpecification(7)
+    baseline = None
+    with SharedProductStore(store) as shared:
+        for processes in range(1, os.cpu_count() + 1):
+            with ParallelFilter(processes, chunk_size) as pf:
+                pf.filter_ids(shared, spec)  # warm the pool up
+                best = min(timeit.repeat(lambda: pf.filter_ids(shared, spec),
+                                         number=1, repeat=repeat))
+            baseline = baseline or best
+            print(f"{processes:>3} processes: {best:.4f}s, "
+                  f"speedup x{baseline / best:.2f}")
+
+
+def benchmark_memory(n=10**6):
+    names = [str(i) for i in range(n)]
+    rows = [(names[i], COLORS[i % 3], SIZES[i // 3 % 3]) for i in range(n)]
+    for label, build in (
+            ("Product", lambda: [Product(*row) for row in rows]),
+            ("CompactProduct", lambda: CompactProduct.from_rows(rows))):
+        tracemalloc.start()
+        products = build()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del products
+        seconds = min(timeit.repeat(build, number=1, repeat=3))
+        print(f"{label:>15}: {size / n:.1f} bytes/product, "
+              f"{n / seconds / 1e6:.2f}M products/s")
+
+
+def benchmark_stream(path, n=10**6):
+    """Write ``n`` products to ``path`` as CSV, then stream-filter them."""
+    with open(path, "w", newline="") as fp:
+        writer = csv.writer(fp)
+        for i in range(n):
+            writer.writerow((i, COLORS[i % 3].name, SIZES[i // 3 % 3].name))
+    spec = ColorSpecification(Color.GREEN) & SizeSpecification(Size.LARGE)
+
+    async def count():
+        return sum([1 async for _ in BetterFilter().afilter(
+            aread_products(path), spec)])
+
+    tracemalloc.start()
+    start = timeit.default_timer()
+    matches = asyncio.run(count())
+    seconds = timeit.default_timer() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{matches} of {n} matched in {seconds:.2f}s, "
+          f"peak memory {peak / 2**20:.1f} MiB")
+
+
+def benchmark_catalog(sizes=(10**4, 10**5, 10**6, 10**7), repeat=3):
+    colors, sizes_ = list(Color), list(Size)
+    spec = ColorSpecification(Color.GREEN) & SizeSpecification(Size.LARGE)
+    for n in sizes:
+        products = [
+            Product(str(i), colors[i % 3], sizes_[i // 3 % 3]) for i in range(n)
+        ]
+        catalog = ProductCatalog(products)
+        scan = min(timeit.repeat(
+            lambda: sum(1 for _ in BetterFilter().filter(products, spec)),
+            number=1, repeat=repeat))
+        indexed = min(timeit.repeat(
+            lambda: sum(1 for _ in IndexedFilter().filter(catalog, spec)),
+            number=1, repeat=repeat))
+        print(f"{n:>10} products: scan {scan:.4f}s, "
+              f"bitmap {indexed:.4f}s, x{scan / indexed:.1f}")
+
 
 if __name__ == "__main__":
     apple = Product("Apple", Color.GREEN, Size.SMALL)
@@ -100,4 +1073,43 @@ if __name__ == "__main__":
         print(p.name)
     print("L and B")
     for p in bf.filter(products, l_B):
-        print(p.name)
\ No newline at end of file
+        print(p.name)
+    print("Indexed L and B")
+    catalog = ProductCatalog(products)
+    for p in IndexedFilter().filter(catalog, l_B):
+        print(p.name)
+    print(QueryPlanner(catalog).plan(l_B).explain())
+    print("Compact L and B")
+    compact = CompactProduct.from_rows(
+        (p.name, p.color, p.size) for p in products)
+    for p in bf.filter(compact, l_B):
+        print(p.name)
+    print("Cached L and B")
+    cached = CachedFilter()
+    for _ in range(3):
+        names = [p.name for p in cached.filter(
+            catalog, SizeSpecification(Size.LARGE) & ColorSpecification(Color.BLUE))]
+    print(names, cached.stats())
+    print("Live view of L and B")
+    view = catalog.register_view(l_B)
+    catalog.add(Product("Sea", Color.BLUE, Size.LARGE))
+    catalog.remove(2)
+    print([p.name for p in view])
+    print("Parallel L and B")
+    with SharedProductStore(ProductStore.from_products(products)) as shared, \
+            ParallelFilter(2) as pf:
+        for p in pf.filter(shared, l_B):
+            print(p.name)
+    print("Blue, or Large and not Green")
+    for p in bf.filter(products, ColorSpecification(Color.BLUE)
+                       | (SizeSpecification(Size.LARGE) & ~greenSpec)):
+        print(p.name)
+    print("Mask of L and B")
+    print(list(bf.filter_mask(ProductStore.from_products(products), l_B)))
+    # benchmark_catalog()
+    # benchmark_compiled()
+    # benchmark_mask()
+    # benchmark_planner()
+    # benchmark_parallel()
+    # benchmark_memory()
+    # benchmark_stream("products.csv")
\ No newline at end of file
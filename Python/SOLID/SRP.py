@@ -1,32 +1,848 @@
+import asyncio
+import bisect
+import json
+import mmap
+import os
+import queue
+import re
+import statistics
+import struct
+import tempfile
+import threading
+import time
+import tracemalloc
+import zlib
+
+
 #  separation of concerns (SOC)
 class Journal:
     def __init__(self) -> None:
         self.entries = []
         self.count = 0
-    
+        # called with ("add", count, text) or ("remove", pos, entry)
+        # after each change; entry starts with its number, which stays
+        # unique, so listeners should key on that rather than on pos
+        self.listeners = []
+
     def add_entry(self, text):
         self.count += 1
         self.entries.append(f"{self.count}: {text}")
+        for listener in self.listeners:
+            listener("add", self.count, text)
 
     def remove_entry(self, pos):
-        del self.entries[pos]
-    
+        entry = self.entries.pop(pos)
+        for listener in self.listeners:
+            listener("remove", pos, entry)
+
     def __str__(self) -> str:
         return "\n".join(self.entries)
 
+    def iter_lines(self):
+        """The lines of str(self), without their newlines."""
+        return iter(self.entries)
+
+    def write_to(self, fp, chunk_size=1 << 16):
+        """Write str(self) to ``fp`` in chunks of about ``chunk_size`` chars."""
+        write_lines(self.iter_lines(), fp, chunk_size)
+
     # def save(self, fileName) -> None:
     #     pass
 
     # def load(self, fileName) -> None:
     #     pass
 
+def write_lines(lines, fp, chunk_size):
+    """
+    Write ``lines`` joined by newlines to ``fp``, buffering at most
+    ``chunk_size`` characters (or one line, if longer) between writes.
+    """
+    buffer, size = [], 0
+    for i, line in enumerate(lines):
+        if i:
+            buffer.append("\n")
+        buffer.append(line)
+        size += len(line) + 1
+        if size >= chunk_size:
+            fp.write("".join(buffer))
+            buffer, size = [], 0
+    if buffer:
+        fp.write("".join(buffer))
+
+class JournalLog:
+    """
+    Append-only log of journal records, one JSON array per line.
+    append() returns once the record is on disk; concurrent callers are
+    group-committed: whichever arrives first writes and fsyncs the whole
+    pending batch while the others wait for it. If a write or fsync fails,
+    every append waiting on that batch raises the error, and so does every
+    later append: the file may end in a torn record, so the log is closed
+    to further writes.
+    """
+
+    def __init__(self, filename, batch_window=0.0) -> None:
+        self.filename = filename
+        # seconds the committing thread waits for more records to join
+        self.batch_window = batch_window
+        self.file = open(filename, "ab")
+        self._cond = threading.Condition()
+        self._pending = []
+        self._queued = 0
+        self._durable = 0
+        self._committing = False
+        self._error = None
+
+    def append(self, *record):
+        self.append_many([record])
+
+    def append_many(self, records):
+        """Append several records; returns once all of them are on disk."""
+        lines = [(json.dumps(record) + "\n").encode() for record in records]
+        with self._cond:
+            self._check()
+            self._pending.extend(lines)
+            self._queued += len(lines)
+            ticket = self._queued
+            while self._durable < ticket:
+                self._check()
+                if self._committing:
+                    self._cond.wait()
+                else:
+                    self._commit()
+
+    def _check(self):
+        # called with the lock held
+        if self._error is not None:
+            raise self._error
+
+    def _commit(self):
+        # called with the lock held; drops it around the write and fsync
+        self._committing = True
+        try:
+            if self.batch_window:
+                self._cond.release()
+                time.sleep(self.batch_window)
+                self._cond.acquire()
+            batch, self._pending = self._pending, []
+            upto = self._queued
+            self._cond.release()
+            try:
+                self.file.write(b"".join(batch))
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            except BaseException as e:
+                self._cond.acquire()
+                self._error = e
+                raise
+            self._cond.acquire()
+            self._durable = upto
+        finally:
+            self._committing = False
+            self._cond.notify_all()
+
+    def compact(self, journal):
+        """Rewrite the log as the minimal records that rebuild ``journal``."""
+        with self._cond:
+            while self._committing or self._pending:
+                self._check()
+                if self._committing:
+                    self._cond.wait()
+                else:
+                    self._commit()
+            tmp = f"{self.filename}.tmp"
+            with open(tmp, "wb") as fp:
+                for entry in journal.entries:
+                    count, text = entry.split(": ", 1)
+                    fp.write((json.dumps(["add", int(count), text]) + "\n").encode())
+                fp.write((json.dumps(["count", journal.count]) + "\n").encode())
+                fp.flush()
+                os.fsync(fp.fileno())
+            self.file.close()
+            os.replace(tmp, self.filename)
+            self.file = open(self.filename, "ab")
+
+    def close(self):
+        self.file.close()
+
+    @staticmethod
+    def replay(filename):
+        journal = Journal()
+        # entry number -> entry; removals are matched by number, not by
+        # position, so logs of MappedJournal slots replay correctly too
+        entries = {}
+        with open(filename, "rb") as fp:
+            for line in fp:
+                op, *args = json.loads(line)
+                if op == "add":
+                    journal.count, text = args
+                    entries[journal.count] = f"{journal.count}: {text}"
+                elif op == "remove":
+                    del entries[int(args[1].split(": ", 1)[0])]
+                elif op == "count":
+                    journal.count = args[0]
+        journal.entries = list(entries.values())
+        return journal
+
+class JournalWriter:
+    """
+    Journal listener that queues records and returns immediately; a
+    background thread drains the queue into ``storage`` (anything with an
+    ``append_many`` such as JournalLog) in batches.
+
+    When the queue is full ``policy`` decides: "block" waits for room,
+    "drop" discards the record, "spill" appends it to a spill file that is
+    written out, in order, once the queue has drained.
+
+    If ``storage`` raises, the batch is lost but the thread keeps going;
+    the error is counted in metrics() and raised by flush() and close().
+    close() detaches the writer from the journals it was attached to, and
+    submits after that raise RuntimeError.
+    """
+
+    def __init__(self, storage, maxsize=1024, policy="block", spill_file=None,
+                 batch_size=256) -> None:
+        if policy not in ("block", "drop", "spill"):
+            raise ValueError(f"unknown policy {policy!r}")
+        self.storage = storage
+        self.policy = policy
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize)
+        self._spill = spill_file
+        self._spilling = False
+        self._cond = threading.Condition()
+        self._submitted = self._done = 0
+        self.dropped = self.spilled = 0
+        self.max_depth = 0
+        self.failed = self.errors = 0
+        self.error = None
+        # running totals rather than one sample per batch
+        self.flushes = 0
+        self._flush_total = self._flush_max = 0.0
+        self.closed = False
+        # submits that passed the closed check but have not queued yet
+        self._putting = 0
+        self._journals = []
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def __call__(self, *record):
+        self.submit(*record)
+
+    def attach(self, journal):
+        """Start writing every later change of ``journal``."""
+        journal.listeners.append(self)
+        self._journals.append(journal)
+        return self
+
+    def submit(self, *record):
+        with self._cond:
+            if self.closed:
+                raise RuntimeError("cannot submit to a closed JournalWriter")
+            self._submitted += 1
+            if self.policy == "spill":
+                # under the lock, so nothing can jump ahead of spilled records
+                if not self._spilling:
+                    try:
+                        self._queue.put_nowait(record)
+                        return
+                    except queue.Full:
+                        pass
+                self._spill_record(record)
+                return
+            self._putting += 1
+        try:
+            self._queue.put(record, block=self.policy == "block")
+        except queue.Full:
+            with self._cond:
+                self.dropped += 1
+                self._done += 1
+            return
+        finally:
+            with self._cond:
+                self._putting -= 1
+                self._cond.notify_all()
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+
+    def _spill_record(self, record):
+        # called with the lock held
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile("w+")
+        self._spill.write(json.dumps(record) + "\n")
+        self._spilling = True
+        self.spilled += 1
+
+    def _take_spilled(self):
+        with self._cond:
+            if not self._spilling:
+                return []
+            self._spill.seek(0)
+            records = [tuple(json.loads(line)) for line in self._spill]
+            self._spill.seek(0)
+            self._spill.truncate()
+            self._spilling = False
+            return records
+
+    def _run(self):
+        while True:
+            batch = []
+            if self._queue.empty():
+                batch = self._take_spilled()
+            if not batch:
+                batch.append(self._queue.get())
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+            closing = batch[-1] is None
+            records = [record for record in batch if record is not None]
+            error = None
+            if records:
+                start = time.perf_counter()
+                try:
+                    self.storage.append_many(records)
+                except Exception as e:
+                    error = e
+                latency = time.perf_counter() - start
+            with self._cond:
+                if records:
+                    self.flushes += 1
+                    self._flush_total += latency
+                    self._flush_max = max(self._flush_max, latency)
+                if error is not None:
+                    self.error = error
+                    self.errors += 1
+                    self.failed += len(records)
+                self._done += len(records)
+                self._cond.notify_all()
+            if closing:
+                return
+
+    def flush(self, timeout=None):
+        """
+        Wait until every record submitted so far has been handled. Raises
+        the last storage error if any batch failed to write.
+        """
+        with self._cond:
+            target = self._submitted
+            done = self._cond.wait_for(lambda: self._done >= target, timeout)
+            if self.error is not None:
+                raise self.error
+            return done
+
+    def close(self):
+        with self._cond:
+            if self.closed:
+                return
+            self.closed = True
+            # records still being queued must land ahead of the stop marker
+            self._cond.wait_for(lambda: not self._putting)
+        for journal in self._journals:
+            journal.listeners.remove(self)
+        self._journals = []
+        try:
+            self.flush()
+        finally:
+            self._queue.put(None)
+            self._thread.join()
+
+    async def aclose(self):
+        await asyncio.to_thread(self.close)
+
+    def metrics(self):
+        with self._cond:
+            return {"queue_depth": self._queue.qsize(),
+                    "max_queue_depth": self.max_depth,
+                    "dropped": self.dropped, "spilled": self.spilled,
+                    "failed": self.failed, "errors": self.errors,
+                    "flushes": self.flushes,
+                    "mean_flush_latency": self._flush_total
+                    / max(self.flushes, 1),
+                    "max_flush_latency": self._flush_max}
+
+class MappedJournal:
+    """
+    Journal kept in a memory-mapped file instead of a list. ``path`` holds
+    the records (a tombstone flag, a length and the entry text) and
+    ``path.idx`` holds the entry count and tombstone count followed by one
+    offset per slot. Opening maps both files without reading the entries.
+
+    Entries are addressed by slot. remove_entry(pos) tombstones the slot in
+    O(1), so later slots keep their positions until compact() drops the
+    tombstones and renumbers the slots like ``del entries[pos]`` would.
+    compact() only runs on its own when ``compact_ratio`` is set, so slots
+    never move under a caller that did not ask for it.
+    """
+
+    _header = struct.Struct("<QQ")
+    _record = struct.Struct("<BI")
+    _offset = struct.Struct("<Q")
+
+    def __init__(self, path, compact_ratio=None) -> None:
+        self.path = path
+        # compact once this fraction of slots are tombstones; None (the
+        # default) leaves compaction to explicit compact() calls
+        self.compact_ratio = compact_ratio
+        self.listeners = []
+        self._open()
+
+    def _open(self):
+        for name in (self.path, self.path + ".idx"):
+            if not os.path.exists(name):
+                open(name, "wb").close()
+        self._data = open(self.path, "r+b")
+        self._index = open(self.path + ".idx", "r+b")
+        if os.fstat(self._index.fileno()).st_size == 0:
+            os.pwrite(self._index.fileno(), self._header.pack(0, 0), 0)
+        self._data_map = self._index_map = None
+        self._data_size = os.fstat(self._data.fileno()).st_size
+        index_size = os.fstat(self._index.fileno()).st_size
+        self.slots = (index_size - self._header.size) // self._offset.size
+        self.count, self.tombstones = self._header.unpack(
+            os.pread(self._index.fileno(), self._header.size, 0))
+
+    def _map(self, file, current, needed):
+        if current is None or len(current) < needed:
+            if current is not None:
+                current.close()
+            current = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return current
+
+    def _write_header(self):
+        os.pwrite(self._index.fileno(),
+                  self._header.pack(self.count, self.tombstones), 0)
+
+    def _locate(self, slot):
+        if not 0 <= slot < self.slots:
+            raise IndexError(slot)
+        position = self._header.size + slot * self._offset.size
+        self._index_map = self._map(self._index, self._index_map,
+                                    position + self._offset.size)
+        offset, = self._offset.unpack_from(self._index_map, position)
+        return offset
+
+    def entry(self, slot):
+        """Text of the entry in ``slot``, or None if it was removed."""
+        offset = self._locate(slot)
+        self._data_map = self._map(self._data, self._data_map,
+                                   offset + self._record.size)
+        removed, length = self._record.unpack_from(self._data_map, offset)
+        if removed:
+            return None
+        start = offset + self._record.size
+        self._data_map = self._map(self._data, self._data_map, start + length)
+        return self._data_map[start:start + length].decode()
+
+    @property
+    def entries(self):
+        return (e for e in map(self.entry, range(self.slots)) if e is not None)
+
+    def add_entry(self, text):
+        self.count += 1
+        data = f"{self.count}: {text}".encode()
+        os.pwrite(self._data.fileno(),
+                  self._record.pack(0, len(data)) + data, self._data_size)
+        os.pwrite(self._index.fileno(), self._offset.pack(self._data_size),
+                  self._header.size + self.slots * self._offset.size)
+        self._data_size += self._record.size + len(data)
+        self.slots += 1
+        self._write_header()
+        for listener in self.listeners:
+            listener("add", self.count, text)
+
+    def remove_entry(self, pos):
+        offset = self._locate(pos)
+        entry = self.entry(pos)
+        if entry is None:
+            raise IndexError(pos)
+        os.pwrite(self._data.fileno(), b"\x01", offset)
+        self.tombstones += 1
+        self._write_header()
+        for listener in self.listeners:
+            listener("remove", pos, entry)
+        if (self.compact_ratio is not None
+                and self.tombstones > self.compact_ratio * self.slots):
+            self.compact()
+
+    def compact(self):
+        """Rewrite both files without the tombstoned entries."""
+        with open(self.path + ".tmp", "wb") as data, \
+                open(self.path + ".idx.tmp", "wb") as index:
+            slots, offset = 0, 0
+            index.write(self._header.pack(self.count, 0))
+            for entry in self.entries:
+                record = entry.encode()
+                data.write(self._record.pack(0, len(record)) + record)
+                index.write(self._offset.pack(offset))
+                offset += self._record.size + len(record)
+                slots += 1
+        self.close()
+        os.replace(self.path + ".tmp", self.path)
+        os.replace(self.path + ".idx.tmp", self.path + ".idx")
+        self._open()
+
+    def close(self):
+        for m in (self._data_map, self._index_map):
+            if m is not None:
+                m.close()
+        self._data.close()
+        self._index.close()
+
+    def __str__(self) -> str:
+        return "\n".join(self.entries)
+
+    def iter_lines(self):
+        return self.entries
+
+    def write_to(self, fp, chunk_size=1 << 16):
+        write_lines(self.iter_lines(), fp, chunk_size)
+
+class BinaryJournal:
+    """
+    Read-only view of a journal saved in the binary format:
+
+        magic | block ... | footer | trailer
+
+    A block is a run of ``<u32 length><utf-8 entry>`` records, zlib
+    compressed when the ``compressed`` flag is set. The footer has one
+    ``<offset, stored length, first entry>`` row per block and the trailer
+    locates the footer. Opening reads only footer and trailer; blocks are
+    decoded the first time one of their entries is accessed.
+    """
+
+    magic = b"JRNL"
+    _length = struct.Struct("<I")
+    _block = struct.Struct("<QII")
+    # footer offset, block count, entry count, journal count, compressed
+    _trailer = struct.Struct("<QIIQB4s")
+
+    def __init__(self, path) -> None:
+        self.file = open(path, "rb")
+        self.file.seek(-self._trailer.size, os.SEEK_END)
+        (footer, blocks, self.size, self.count, self.compressed,
+         magic) = self._trailer.unpack(self.file.read(self._trailer.size))
+        if magic != self.magic:
+            raise ValueError(f"{path} is not a binary journal")
+        self.file.seek(footer)
+        rows = list(self._block.iter_unpack(
+            self.file.read(blocks * self._block.size)))
+        self._offsets = [row[0] for row in rows]
+        self._lengths = [row[1] for row in rows]
+        self._firsts = [row[2] for row in rows]
+        self._cached = (None, None)
+
+    @classmethod
+    def write(cls, journal, path, compress=True, block_size=1024):
+        rows = []
+        with open(path, "wb") as fp:
+            fp.write(cls.magic)
+            entries = journal.entries
+            for first in range(0, len(entries), block_size):
+                block = b"".join(
+                    cls._length.pack(len(data)) + data
+                    for data in (e.encode()
+                                 for e in entries[first:first + block_size]))
+                if compress:
+                    block = zlib.compress(block)
+                rows.append(cls._block.pack(fp.tell(), len(block), first))
+                fp.write(block)
+            footer = fp.tell()
+            fp.write(b"".join(rows))
+            fp.write(cls._trailer.pack(footer, len(rows), len(entries),
+                                       journal.count, compress, cls.magic))
+
+    def _decode(self, block):
+        if self._cached[0] != block:
+            self.file.seek(self._offsets[block])
+            data = self.file.read(self._lengths[block])
+            if self.compressed:
+                data = zlib.decompress(data)
+            entries, position = [], 0
+            while position < len(data):
+                length, = self._length.unpack_from(data, position)
+                position += self._length.size
+                entries.append(data[position:position + length].decode())
+                position += length
+            self._cached = (block, entries)
+        return self._cached[1]
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, pos):
+        if not 0 <= pos < self.size:
+            raise IndexError(pos)
+        block = bisect.bisect_right(self._firsts, pos) - 1
+        return self._decode(block)[pos - self._firsts[block]]
+
+    def __iter__(self):
+        for block in range(len(self._offsets)):
+            yield from self._decode(block)
+
+    def __str__(self) -> str:
+        return "\n".join(self)
+
+    def iter_lines(self):
+        return iter(self)
+
+    def write_to(self, fp, chunk_size=1 << 16):
+        write_lines(self.iter_lines(), fp, chunk_size)
+
+    def to_journal(self):
+        journal = Journal()
+        journal.entries = list(self)
+        journal.count = self.count
+        return journal
+
+    def close(self):
+        self.file.close()
+
+class JournalIndex:
+    """
+    Inverted index from lower-cased word tokens to the numbers of the
+    entries containing them. Attach it as a journal listener and it
+    follows every add_entry/remove_entry.
+    """
+
+    _token = re.compile(r"\w+")
+
+    def __init__(self) -> None:
+        self.postings = {}
+        # sorted tokens, for prefix search
+        self.vocabulary = []
+
+    @classmethod
+    def build(cls, journal):
+        index = cls()
+        for entry in journal.entries:
+            count, text = entry.split(": ", 1)
+            index._add(int(count), text)
+        journal.listeners.append(index)
+        return index
+
+    def tokens(self, text):
+        return set(self._token.findall(text.lower()))
+
+    def __call__(self, op, *args):
+        if op == "add":
+            self._add(*args)
+        elif op == "remove":
+            count, text = args[1].split(": ", 1)
+            self._remove(int(count), text)
+
+    def _add(self, number, text):
+        for token in self.tokens(text):
+            numbers = self.postings.get(token)
+            if numbers is None:
+                numbers = self.postings[token] = set()
+                bisect.insort(self.vocabulary, token)
+            numbers.add(number)
+
+    def _remove(self, number, text):
+        for token in self.tokens(text):
+            numbers = self.postings[token]
+            numbers.discard(number)
+            if not numbers:
+                del self.postings[token]
+                del self.vocabulary[bisect.bisect_left(self.vocabulary, token)]
+
+    def search(self, *terms, mode="and"):
+        """Sorted numbers of the entries containing all (or any) ``terms``."""
+        sets = [self.postings.get(term.lower(), set()) for term in terms]
+        if not sets:
+            return []
+        if mode == "and":
+            sets.sort(key=len)
+            result = sets[0].intersection(*sets[1:])
+        elif mode == "or":
+            result = set().union(*sets)
+        else:
+            raise ValueError(f"unknown mode {mode!r}")
+        return sorted(result)
+
+    def search_prefix(self, prefix):
+        """Sorted numbers of the entries with a token starting with ``prefix``."""
+        prefix = prefix.lower()
+        vocabulary = self.vocabulary
+        start = bisect.bisect_left(vocabulary, prefix)
+        result = set()
+        # walk from start by index: slicing would copy the vocabulary tail
+        for i in range(start, len(vocabulary)):
+            token = vocabulary[i]
+            if not token.startswith(prefix):
+                break
+            result |= self.postings[token]
+        return sorted(result)
+
+    def save(self, filename):
+        with open(filename, "w") as fp:
+            json.dump({token: sorted(numbers)
+                       for token, numbers in self.postings.items()}, fp)
+
+    @classmethod
+    def load(cls, filename, journal=None):
+        index = cls()
+        with open(filename) as fp:
+            index.postings = {token: set(numbers)
+                              for token, numbers in json.load(fp).items()}
+        index.vocabulary = sorted(index.postings)
+        if journal is not None:
+            journal.listeners.append(index)
+        return index
+
 class PersistenceManager():
     @staticmethod
     def save_to_file(journal, filename):
-        pass
+        with open(filename, "w") as fp:
+            journal.write_to(fp)
+            fp.flush()
+            os.fsync(fp.fileno())
+
+    @staticmethod
+    def attach(journal, filename, batch_window=0.0):
+        """Log every later change of ``journal`` durably to ``filename``."""
+        log = JournalLog(filename, batch_window)
+        journal.listeners.append(log.append)
+        return log
+
+    @staticmethod
+    def attach_background(journal, filename, batch_window=0.0, **options):
+        """Like attach, but the writes happen on a JournalWriter thread."""
+        writer = JournalWriter(JournalLog(filename, batch_window), **options)
+        return writer.attach(journal)
+
+    @staticmethod
+    def load_from_log(filename):
+        return JournalLog.replay(filename)
+
+    @staticmethod
+    def save_binary(journal, filename, compress=True):
+        BinaryJournal.write(journal, filename, compress)
+
+    @staticmethod
+    def load_binary(filename):
+        return BinaryJournal(filename)
+
+
+def benchmark_log(filename, windows=(0.0, 0.0005, 0.002), threads=16,
+                  per_thread=200):
+    for window in windows:
+        if os.path.exists(filename):
+            os.remove(filename)
+        log = JournalLog(filename, window)
+        latencies = []
+
+        def writer(n):
+            for i in range(per_thread):
+                start = time.perf_counter()
+                log.append("add", i, f"entry {n}-{i}")
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        workers = [threading.Thread(target=writer, args=(n,))
+                   for n in range(threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        seconds = time.perf_counter() - start
+        log.close()
+        q = statistics.quantiles(latencies, n=100)
+        print(f"window {window * 1000:.1f}ms: "
+              f"{len(latencies) / seconds:.0f} entries/s, "
+              f"p50 {q[49] * 1000:.2f}ms p99 {q[98] * 1000:.2f}ms")
+
+
+def benchmark_mapped(path, n=10**6):
+    for name in (path, path + ".idx"):
+        if os.path.exists(name):
+            os.remove(name)
+    journal = MappedJournal(path, compact_ratio=None)
+    start = time.perf_counter()
+    for i in range(n):
+        journal.add_entry(f"entry number {i}")
+    print(f"{n} adds: {time.perf_counter() - start:.2f}s")
+    journal.close()
+    start = time.perf_counter()
+    journal = MappedJournal(path, compact_ratio=None)
+    print(f"open: {(time.perf_counter() - start) * 1000:.2f}ms, "
+          f"last entry {journal.entry(n - 1)!r}")
+    start = time.perf_counter()
+    for pos in range(0, n, 2):
+        journal.remove_entry(pos)
+    print(f"{n // 2} removals: {time.perf_counter() - start:.2f}s")
+    start = time.perf_counter()
+    journal.compact()
+    print(f"compaction: {time.perf_counter() - start:.2f}s, "
+          f"{journal.slots} entries left")
+    journal.close()
+
+
+def benchmark_binary(path, n=10**6):
+    journal = Journal()
+    for i in range(n):
+        journal.add_entry(f"today I wrote entry number {i}")
+    PersistenceManager.save_to_file(journal, path + ".txt")
+    start = time.perf_counter()
+    with open(path + ".txt") as fp:
+        text = fp.read().split("\n")
+    print(f"text: {os.path.getsize(path + '.txt')} bytes, "
+          f"load {(time.perf_counter() - start) * 1000:.1f}ms")
+    for compress in (False, True):
+        PersistenceManager.save_binary(journal, path, compress)
+        start = time.perf_counter()
+        binary = PersistenceManager.load_binary(path)
+        seconds = time.perf_counter() - start
+        assert binary[n - 1] == text[n - 1]
+        binary.close()
+        print(f"binary{' (zlib)' if compress else ''}: "
+              f"{os.path.getsize(path)} bytes, open {seconds * 1000:.2f}ms")
+
+
+def benchmark_index(n=10**6):
+    words = ["bug", "cried", "ate", "walked", "slept", "wrote", "read", "ran"]
+    journal = Journal()
+    index = JournalIndex.build(journal)
+    start = time.perf_counter()
+    for i in range(n):
+        journal.add_entry(f"I {words[i % 8]} and {words[i * 7 % 8]} at {i % 997}")
+    print(f"{n} indexed adds: {time.perf_counter() - start:.2f}s")
+    start = time.perf_counter()
+    scanned = [e for e in journal.entries if " bug " in e and e.endswith(" 42")]
+    print(f"substring scan: {(time.perf_counter() - start) * 1000:.1f}ms")
+    start = time.perf_counter()
+    found = index.search("bug", "42")
+    print(f"index search: {(time.perf_counter() - start) * 1000:.1f}ms, "
+          f"{len(found)} hits (scan {len(scanned)})")
+    start = time.perf_counter()
+    found = index.search_prefix("slep")
+    print(f"prefix search: {(time.perf_counter() - start) * 1000:.1f}ms, "
+          f"{len(found)} hits")
+
+
+def benchmark_export(path, n=10**6):
+    journal = Journal()
+    for i in range(n):
+        journal.add_entry(f"today I wrote entry number {i}")
+    for label, export in (
+            ("str()", lambda fp: fp.write(str(journal))),
+            ("write_to", journal.write_to)):
+        tracemalloc.start()
+        with open(path, "w") as fp:
+            export(fp)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{label:>8}: peak {peak / 2**20:.2f} MiB")
+
 
-J = Journal()
-J.add_entry("I cried today")
-J.add_entry("I ate a bug")
-PersistenceManager.save_to_file(J, "abc.txt")
-print(J)
\ No newline at end of file
+if __name__ == "__main__":
+    J = Journal()
+    J.add_entry("I cried today")
+    J.add_entry("I ate a bug")
+    PersistenceManager.save_to_file(J, "abc.txt")
+    print(J)
+    # benchmark_log("journal.log")
+    # benchmark_mapped("journal.dat")
+    # benchmark_binary("journal.bin")
+    # benchmark_index()
+    # benchmark_export("journal.txt")